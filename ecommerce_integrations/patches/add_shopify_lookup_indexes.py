@@ -0,0 +1,62 @@
+import frappe
+
+from ecommerce_integrations.shopify.constants import CUSTOMER_ID_FIELD, SETTING_DOCTYPE
+from ecommerce_integrations.shopify.doctype.shopify_setting.shopify_setting import (
+	CUSTOM_FIELDS_HASH,
+	setup_custom_fields,
+)
+
+# fieldname the Shopify Customer ID was created with before it became CUSTOMER_ID_FIELD
+OLD_CUSTOMER_ID_FIELD = "custom_shopify_customer_id"
+
+
+def execute():
+	# Shopify customer and address IDs are indexed through their unique custom fields
+	settings = frappe.get_doc(SETTING_DOCTYPE)
+	has_old_field = frappe.db.has_column("Customer", OLD_CUSTOMER_ID_FIELD)
+	if settings.is_enabled() or has_old_field:
+		setup_custom_fields()
+		# same bookkeeping as ShopifySetting.validate, so saving the settings doesn't redo it
+		frappe.db.set_single_value(SETTING_DOCTYPE, "custom_fields_hash", CUSTOM_FIELDS_HASH)
+
+	if has_old_field:
+		move_customer_ids()
+
+	# contacts of imported Shopify customers are matched on phone number
+	frappe.db.add_index("Contact", ["phone"])
+
+
+def move_customer_ids():
+	# CUSTOMER_ID_FIELD is unique, an ID already set on another customer is not copied again
+	frappe.db.sql(
+		f"""
+		update `tabCustomer` set `{CUSTOMER_ID_FIELD}` = `{OLD_CUSTOMER_ID_FIELD}`
+		where coalesce(`{CUSTOMER_ID_FIELD}`, '') = ''
+			and coalesce(`{OLD_CUSTOMER_ID_FIELD}`, '') != ''
+			and `{OLD_CUSTOMER_ID_FIELD}` not in (
+				select taken.id from (
+					select `{CUSTOMER_ID_FIELD}` as id from `tabCustomer`
+					where coalesce(`{CUSTOMER_ID_FIELD}`, '') != ''
+				) taken
+			)
+		"""
+	)
+
+	skipped = frappe.db.sql(
+		f"""
+		select name, `{OLD_CUSTOMER_ID_FIELD}` from `tabCustomer`
+		where coalesce(`{OLD_CUSTOMER_ID_FIELD}`, '') != ''
+			and coalesce(`{CUSTOMER_ID_FIELD}`, '') != `{OLD_CUSTOMER_ID_FIELD}`
+		"""
+	)
+	if skipped:
+		# the old column is the only record of these IDs, keep it until they are resolved by hand
+		frappe.log_error(
+			"\n".join(f"{name}: {customer_id}" for name, customer_id in skipped),
+			f"Shopify Customer IDs not moved from {OLD_CUSTOMER_ID_FIELD}",
+		)
+		return
+
+	frappe.delete_doc_if_exists("Custom Field", f"Customer-{OLD_CUSTOMER_ID_FIELD}")
+	if frappe.db.has_column("Customer", OLD_CUSTOMER_ID_FIELD):
+		frappe.db.sql_ddl(f"alter table `tabCustomer` drop column `{OLD_CUSTOMER_ID_FIELD}`")
@@ -1,17 +1,17 @@
-# Updated get_shopify_customers function to handle pagination
 import functools
 import hmac
 import hashlib
 import base64
-import json
+import binascii
 import requests
 import time
-import phonenumbers
+from concurrent.futures import ThreadPoolExecutor
+import orjson
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 import frappe
 from frappe import _
-from shopify.session import Session
-from shopify.resources import Webhook, Customer
 
 from ecommerce_integrations.shopify.constants import (
     API_VERSION,
@@ -21,6 +21,63 @@ from ecommerce_integrations.shopify.constants import (
 )
 from ecommerce_integrations.shopify.utils import create_shopify_log
 
+# Shared HTTP session so that paginated fetches and webhook calls reuse pooled
+# TLS connections instead of opening a new one per request.
+_SESSION = requests.Session()
+_SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=10,
+        max_retries=Retry(
+            total=5,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            raise_on_status=False,
+        ),
+    ),
+)
+_SESSION.headers.update({"Content-Type": "application/json"})
+
+
+# webhook bodies above this size (in bytes) are rejected before HMAC verification
+MAX_WEBHOOK_PAYLOAD_SIZE = 5 * 1024 * 1024
+
+# concurrent DELETEs while tearing down webhooks, kept well below the 40 call bucket
+WEBHOOK_DELETE_WORKERS = 8
+
+# pause pagination once this fraction of the leaky bucket (40 calls, 80 on Plus) is used up
+RATE_LIMIT_THRESHOLD = 0.8
+# calls per second drained from the REST bucket (doubled on Plus stores, so this is conservative)
+REST_LEAK_RATE = 2
+
+# inactive locations count towards the page size as well, so pages are followed until the last one
+LOCATIONS_QUERY = """
+query($after: String) {
+    locations(first: 250, after: $after, includeInactive: true) {
+        edges { node { legacyResourceId name } }
+        pageInfo { hasNextPage endCursor }
+    }
+}
+"""
+
+
+def _get_settings():
+    """Return the Shopify Setting single doc from document cache."""
+    return frappe.get_cached_doc(SETTING_DOCTYPE)
+
+
+def _get_auth_details() -> tuple[str, str]:
+    """Return (shopify_url, password), decrypting the password once per settings revision."""
+    modified = frappe.get_cached_value(SETTING_DOCTYPE, SETTING_DOCTYPE, "modified")
+    return _get_auth_details_for(frappe.local.site, str(modified))
+
+
+@functools.lru_cache(maxsize=8)
+def _get_auth_details_for(site: str, modified: str) -> tuple[str, str]:
+    setting = _get_settings()
+    return setting.shopify_url, setting.get_password("password")
+
 
 def temp_shopify_session(func):
     """Decorator to manage Shopify API session."""
@@ -30,25 +87,21 @@ def temp_shopify_session(func):
         if frappe.flags.in_test:
             return func(*args, **kwargs)
 
-        setting = frappe.get_doc(SETTING_DOCTYPE)
+        setting = _get_settings()
         if setting.is_enabled():
-            shopify_url = setting.shopify_url
-            api_version = API_VERSION
-            password = setting.get_password("password")
-
-            # Debug: Log individual components
-            frappe.logger().debug(f"Shopify URL: {shopify_url}")
-            frappe.logger().debug(f"API Version: {api_version}")
-            frappe.logger().debug(f"Password Retrieved: {'Yes' if password else 'No'}")
+            shopify_url, password = _get_auth_details()
 
             if not shopify_url or not password:
                 frappe.log_error(
-                    frappe.get_traceback(),
+                    f"Shopify URL set: {bool(shopify_url)}, password set: {bool(password)}",
                     'Shopify Auth Error: Missing shopify_url or password'
                 )
                 frappe.throw(_("Shopify URL or Password is not set correctly."))
 
-            auth_details = (shopify_url, api_version, password)
+            auth_details = (shopify_url, API_VERSION, password)
+
+            # imported lazily, webhook requests never need the ActiveResource client
+            from shopify.session import Session
 
             with Session.temp(*auth_details):
                 return func(*args, **kwargs)
@@ -58,27 +111,33 @@ def temp_shopify_session(func):
     return wrapper
 
 
-@temp_shopify_session
 def get_shopify_customers():
     """
     Fetch all customers from Shopify using cursor-based pagination with requests.
+
+    Prefer `iter_shopify_customers` for large stores, this materializes every customer in memory.
     """
-    customers = []
-    settings = frappe.get_doc(SETTING_DOCTYPE)
-    shopify_url = settings.shopify_url
-    password = settings.get_password("password")
-    endpoint = f"https://{shopify_url}/admin/api/{API_VERSION}/customers.json"
-
-    params = {
-        "limit": 250
-    }
-    headers = {
-        "Content-Type": "application/json",
-        "X-Shopify-Access-Token": password
-    }
+    return list(iter_shopify_customers())
 
-    while True:
-        response = requests.get(endpoint, headers=headers, params=params)
+
+def iter_shopify_customers(batch_size: int = 250):
+    """Yield Shopify customers one page at a time, following the Link header cursor.
+
+    Legacy REST export kept for API compatibility, the customer import uses
+    `shopify_bulk.bulk_export_customers` instead."""
+    settings = _get_settings()
+    if not settings.is_enabled():
+        frappe.throw(_("Shopify integration is not enabled."))
+
+    shopify_url, password = _get_auth_details()
+    headers = {"X-Shopify-Access-Token": password}
+
+    url = f"https://{shopify_url}/admin/api/{API_VERSION}/customers.json"
+    # the next link already carries `limit` and the `page_info` cursor
+    params = {"limit": batch_size}
+    while url:
+        # 429s are retried by the session adapter, honouring Retry-After
+        response = _SESSION.get(url, headers=headers, params=params)
         if response.status_code != 200:
             frappe.log_error(
                 f"Error fetching customers from Shopify: {response.text}",
@@ -86,42 +145,43 @@ def get_shopify_customers():
             )
             frappe.throw(f"Error fetching customers from Shopify: {response.status_code}")
 
-        data = response.json().get("customers", [])
-        customers.extend(data)
-
-        # Check for pagination link in headers (Link header for cursor-based pagination)
-        if "Link" in response.headers:
-            links = response.headers["Link"].split(",")
-            next_link = None
-            for link in links:
-                if 'rel="next"' in link:
-                    next_link = link.split(";")[0].strip(" <>")
-                    break
-            if next_link:
-                endpoint = next_link
-            else:
-                break
-        else:
-            break
+        yield from orjson.loads(response.content).get("customers", [])
+
+        url = _get_next_page_url(response)
+        params = None
+        if url:
+            _wait_for_rate_limit(response)
+
 
-    return customers
+def _get_next_page_url(response: requests.Response) -> str | None:
+    """URL of the rel="next" page from the Link header, None on the last page."""
+    return response.links.get("next", {}).get("url")
+
+
+def _wait_for_rate_limit(response) -> None:
+    """Pace requests once the API call bucket Shopify reports is above the threshold.
+
+    Sleeps just long enough for the bucket to leak back down to the threshold, the reported
+    usage includes calls made by every other app on the store."""
+    call_limit = response.headers.get("X-Shopify-Shop-Api-Call-Limit")
+    if not call_limit:
+        return
+
+    used, limit = map(int, call_limit.split("/"))
+    excess = used + 1 - limit * RATE_LIMIT_THRESHOLD
+    if excess > 0:
+        time.sleep(excess / REST_LEAK_RATE)
 
 
 def get_shopify_webhooks():
     """Fetch webhooks from Shopify and return response."""
-    settings = frappe.get_doc(SETTING_DOCTYPE)
-    shopify_url = settings.shopify_url
-    password = settings.get_password("password")
+    shopify_url, password = _get_auth_details()
     endpoint = f"https://{shopify_url}/admin/api/{API_VERSION}/webhooks.json"
+    headers = {"X-Shopify-Access-Token": password}
 
-    headers = {
-        "Content-Type": "application/json",
-        "X-Shopify-Access-Token": password
-    }
-
-    response = requests.get(endpoint, headers=headers)
+    response = _SESSION.get(endpoint, headers=headers)
     if response.status_code == 200:
-        return response.json()
+        return orjson.loads(response.content)
     else:
         frappe.log_error(response.text, 'Shopify Fetch Webhooks Error')
         frappe.throw(f"Error fetching webhooks from Shopify: {response.text}")
@@ -129,32 +189,144 @@ def get_shopify_webhooks():
 
 def unregister_shopify_webhooks():
     """Unregister all webhooks from Shopify."""
-    settings = frappe.get_doc(SETTING_DOCTYPE)
-    shopify_url = settings.shopify_url
-    password = settings.get_password("password")
-    endpoint = f"https://{shopify_url}/admin/api/{API_VERSION}/webhooks.json"
+    shopify_url, password = _get_auth_details()
+    base_url = f"https://{shopify_url}/admin/api/{API_VERSION}"
+    headers = {"X-Shopify-Access-Token": password}
 
-    headers = {
-        "Content-Type": "application/json",
-        "X-Shopify-Access-Token": password
-    }
-
-    response = requests.get(endpoint, headers=headers)
+    response = _SESSION.get(f"{base_url}/webhooks.json", headers=headers)
     if response.status_code == 200:
-        webhooks = response.json().get("webhooks", [])
-        for webhook in webhooks:
-            delete_endpoint = f"{endpoint}/{webhook['id']}.json"
-            delete_response = requests.delete(delete_endpoint, headers=headers)
+        webhook_ids = [webhook["id"] for webhook in orjson.loads(response.content).get("webhooks", [])]
+        responses = _delete_webhooks(base_url, headers, webhook_ids)
+        for webhook_id, delete_response in zip(webhook_ids, responses):
             if delete_response.status_code != 200:
                 frappe.log_error(
                     delete_response.text, 'Shopify Unregister Webhooks Error'
                 )
-                frappe.throw(f"Error unregistering webhook {webhook['id']}: {delete_response.text}")
+                frappe.throw(f"Error unregistering webhook {webhook_id}: {delete_response.text}")
     else:
         frappe.log_error(response.text, 'Shopify Unregister Webhooks Error')
         frappe.throw(f"Error fetching webhooks from Shopify: {response.text}")
 
 
+def _delete_webhooks(base_url: str, headers: dict, webhook_ids: list) -> list[requests.Response]:
+    """Delete webhooks concurrently over the pooled session, responses are returned in input order.
+
+    Only HTTP calls run in worker threads, callers handle logging on the main thread."""
+    urls = [f"{base_url}/webhooks/{webhook_id}.json" for webhook_id in webhook_ids]
+    with ThreadPoolExecutor(max_workers=WEBHOOK_DELETE_WORKERS) as executor:
+        return list(executor.map(lambda url: _SESSION.delete(url, headers=headers), urls))
+
+
+def register_webhooks(shopify_url: str, password: str) -> list[frappe._dict]:
+    """Register required webhooks with shopify and return registered webhooks.
+
+    All topics are subscribed with a single GraphQL request using one aliased mutation per topic."""
+    new_webhooks = []
+
+    # clear all stale webhooks matching current site url before registering new ones
+    unregister_webhooks(shopify_url, password)
+
+    response = graphql_request(
+        shopify_url,
+        password,
+        _webhook_subscription_mutation(WEBHOOK_EVENTS),
+        variables={"callbackUrl": get_callback_url()},
+    )
+    if response.status_code != 200:
+        create_shopify_log(
+            status="Error",
+            response_data=response.text,
+            exception=f"Error registering webhooks: {response.status_code}",
+        )
+        return new_webhooks
+
+    body = orjson.loads(response.content)
+    if body.get("errors"):
+        # the whole mutation was rejected, e.g. invalid callback URL or missing access scope
+        create_shopify_log(
+            status="Error",
+            response_data=body["errors"],
+            exception=f"Error registering webhooks: {body['errors']}",
+        )
+        return new_webhooks
+
+    data = body.get("data") or {}
+    for idx, topic in enumerate(WEBHOOK_EVENTS):
+        result = data.get(f"w{idx}") or {}
+        subscription = result.get("webhookSubscription")
+
+        if subscription:
+            new_webhooks.append(frappe._dict(id=subscription["legacyResourceId"], topic=topic))
+        else:
+            create_shopify_log(
+                status="Error",
+                response_data=result,
+                exception=f"Error registering webhook {topic}",
+            )
+
+    return new_webhooks
+
+
+def _webhook_subscription_mutation(topics: list[str]) -> str:
+    """Build one GraphQL mutation creating a webhook subscription for every topic.
+
+    Each subscription is aliased as w<index> so results can be matched back to `topics`."""
+    subscriptions = "\n".join(
+        f"w{idx}: webhookSubscriptionCreate("
+        f"topic: {topic.upper().replace('/', '_')}, "
+        "webhookSubscription: {callbackUrl: $callbackUrl, format: JSON}) "
+        "{ webhookSubscription { legacyResourceId } userErrors { field message } }"
+        for idx, topic in enumerate(topics)
+    )
+    return f"mutation($callbackUrl: URL!) {{\n{subscriptions}\n}}"
+
+
+def graphql_request(shopify_url: str, password: str, query: str, variables: dict | None = None):
+    """POST a query to Shopify's GraphQL Admin API over the pooled session."""
+    return _SESSION.post(
+        f"https://{shopify_url}/admin/api/{API_VERSION}/graphql.json",
+        headers={"X-Shopify-Access-Token": password},
+        data=orjson.dumps({"query": query, "variables": variables or {}}),
+    )
+
+
+def get_shopify_locations(shopify_url: str, password: str) -> list[frappe._dict]:
+    """Fetch all Shopify locations (id, name), one GraphQL request per 250 locations."""
+    locations = []
+    cursor = None
+    while True:
+        response = graphql_request(shopify_url, password, LOCATIONS_QUERY, variables={"after": cursor})
+        body = orjson.loads(response.content) if response.status_code == 200 else {}
+        if not body.get("data"):
+            frappe.log_error(response.text, "Shopify Locations Fetch Error")
+            frappe.throw(_("Error fetching locations from Shopify: {0}").format(response.status_code))
+
+        page = body["data"]["locations"]
+        locations.extend(
+            frappe._dict(id=edge["node"]["legacyResourceId"], name=edge["node"]["name"])
+            for edge in page["edges"]
+        )
+        if not page["pageInfo"]["hasNextPage"]:
+            return locations
+
+        cursor = page["pageInfo"]["endCursor"]
+
+
+def unregister_webhooks(shopify_url: str, password: str) -> None:
+    """Unregister all webhooks from shopify that correspond to current site url."""
+    url = get_current_domain_name()
+    base_url = f"https://{shopify_url}/admin/api/{API_VERSION}"
+    headers = {"X-Shopify-Access-Token": password}
+
+    response = _SESSION.get(f"{base_url}/webhooks.json", headers=headers)
+    if response.status_code != 200:
+        frappe.log_error(response.text, "Shopify Unregister Webhooks Error")
+        return
+
+    webhooks = orjson.loads(response.content).get("webhooks", [])
+    _delete_webhooks(base_url, headers, [wh["id"] for wh in webhooks if url in wh.get("address", "")])
+
+
 def get_current_domain_name() -> str:
     """Get current site domain name, e.g., test.erpnext.com.
 
@@ -178,97 +350,67 @@ def get_callback_url() -> str:
 @frappe.whitelist(allow_guest=True)
 def store_request_data() -> None:
     if frappe.request:
+        if (frappe.request.content_length or 0) > MAX_WEBHOOK_PAYLOAD_SIZE:
+            frappe.throw(_("Payload too large"), frappe.SecurityException)
+
         hmac_header = frappe.get_request_header("X-Shopify-Hmac-Sha256")
         _validate_request(frappe.request, hmac_header)
-        data = json.loads(frappe.request.data)
+        data = orjson.loads(frappe.request.data)
         event = frappe.request.headers.get("X-Shopify-Topic")
         process_request(data, event)
 
 
 def process_request(data, event):
-    # Create log
-    log = create_shopify_log(method=EVENT_MAPPER[event], request_data=data)
+    method = EVENT_MAPPER[event]
 
-    # Enqueue background job
+    # Log is created by the worker as well, the request only pays for one enqueue
+    # and stays well within Shopify's webhook timeout.
     frappe.enqueue(
-        method=EVENT_MAPPER[event],
+        method=process_webhook,
         queue="short",
         timeout=300,
         is_async=True,
-        **{"payload": data, "request_id": log.name},
+        **{"event_method": method, "payload": data},
     )
 
 
+def process_webhook(event_method, payload):
+    """Log the webhook payload and hand it over to the handler mapped to its topic."""
+    log = create_shopify_log(method=event_method, request_data=payload)
+    _get_event_handler(event_method)(payload=payload, request_id=log.name)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_event_handler(event_method: str):
+    """Resolve the dotted handler path once per process.
+
+    Handlers import this module, so they can't be resolved at import time of `connection`."""
+    return frappe.get_attr(event_method)
+
+
 def _validate_request(req, hmac_header):
-    settings = frappe.get_doc(SETTING_DOCTYPE)
-    secret_key = settings.shared_secret
+    try:
+        expected = base64.b64decode(hmac_header or "", validate=True)
+    except binascii.Error:
+        expected = b""
 
-    sig = base64.b64encode(hmac.new(secret_key.encode("utf8"), req.data, hashlib.sha256).digest())
+    mac = _webhook_hmac().copy()
+    mac.update(req.data)
+    sig = mac.digest()
 
-    if sig != bytes(hmac_header.encode()):
+    if not hmac.compare_digest(sig, expected):
         create_shopify_log(status="Error", request_data=req.data)
         frappe.throw(_("Unverified Webhook Data"))
 
 
-def handle_customer_contacts(customer, customer_data):
-    """
-    Creates or updates a contact based on the phone number and links it to the customer.
-    """
-    phone = customer_data.get('phone')
+def _webhook_hmac() -> hmac.HMAC:
+    """Keyed HMAC for the webhook shared secret, `copy()` it before feeding data.
 
-    try:
-        # Normalize the phone number if provided
-        if phone:
-            try:
-                parsed_phone = phonenumbers.parse(phone, "US")  # Adjust default country as needed
-                phone = phonenumbers.format_number(parsed_phone, phonenumbers.PhoneNumberFormat.E164)
-            except phonenumbers.NumberParseException:
-                frappe.log_error(f"Invalid phone number format for customer {customer.name}: {phone}", "Shopify Contact Import Warning")
-                return  # Skip contact creation if the phone number is invalid
-
-        # Check if a contact with the same phone already exists
-        existing_contact_name = None
-        if phone:
-            existing_contact_name = frappe.db.get_value('Contact', {
-                'phone': phone,
-            }, 'name')
-
-        contact_fields = {
-            'doctype': 'Contact',
-            'first_name': customer_data.get('first_name') or customer.customer_name,
-            'last_name': customer_data.get('last_name') or '',
-            'phone': phone
-        }
-
-        if existing_contact_name:
-            # Update existing contact without modifying links
-            contact = frappe.get_doc('Contact', existing_contact_name)
-            contact.update(contact_fields)
-        else:
-            # Create new contact without setting links
-            contact = frappe.get_doc(contact_fields)
-
-        contact.flags.ignore_mandatory = True
-        contact.save(ignore_permissions=True)
-
-        # Link contact to customer
-        link_exists = frappe.db.exists('Dynamic Link', {
-            'link_doctype': 'Customer',
-            'link_name': customer.name,
-            'parenttype': 'Contact',
-            'parent': contact.name
-        })
-
-        if not link_exists:
-            contact.append('links', {
-                'link_doctype': 'Customer',
-                'link_name': customer.name
-            })
-            contact.save(ignore_permissions=True)
-
-    except Exception as e:
-        frappe.log_error(
-            f"Error importing contact for customer {customer.name}: {frappe.get_traceback()}",
-            'Shopify Contact Import Error'
-        )
-        frappe.throw(f"Error importing contact: {e}")
+    The secret comes from the document cache, which is invalidated on every save of the
+    settings, so a rotated secret gets a fresh template in all workers without explicit clearing."""
+    return _hmac_template(frappe.get_cached_value(SETTING_DOCTYPE, SETTING_DOCTYPE, "shared_secret"))
+
+
+@functools.lru_cache(maxsize=8)
+def _hmac_template(secret: str) -> hmac.HMAC:
+    return hmac.new(secret.encode("utf8"), None, hashlib.sha256)
@@ -33,15 +33,9 @@ frappe.ui.form.on("Shopify Setting", {
                 integration: "Shopify",
             });
         });
-        // Updated "Import All Customers" button to use ShopifyCustomer class method
         frm.add_custom_button(__("Import All Customers"), function () {
             frappe.call({
-                method: 'ecommerce_integrations.shopify.sync_customers.ShopifyCustomer.sync_all_customers',
-                callback: function(r) {
-                    if (!r.exc) {
-                        frappe.msgprint(__('All customers have been imported successfully.'));
-                    }
-                }
+                method: "ecommerce_integrations.shopify.doctype.shopify_setting.shopify_setting.import_all_customers",
             });
         });
         frm.trigger("setup_queries");
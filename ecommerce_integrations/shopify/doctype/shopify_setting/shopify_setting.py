@@ -3,13 +3,13 @@
 # Copyright (c) 2021, Frappe and contributors
 # For license information, please see LICENSE
 
+import hashlib
+
 import frappe
 from frappe import _
 from frappe.custom.doctype.custom_field.custom_field import create_custom_fields
 from frappe.utils import get_datetime
 from frappe.utils.background_jobs import enqueue  # Added import
-from shopify.collection import PaginatedIterator
-from shopify.resources import Location
 
 from ecommerce_integrations.controllers.setting import (
     ERPNextWarehouse,
@@ -26,13 +26,13 @@ from ecommerce_integrations.shopify.constants import (
     ORDER_ITEM_DISCOUNT_FIELD,
     ORDER_NUMBER_FIELD,
     ORDER_STATUS_FIELD,
+    PAYLOAD_HASH_FIELD,
     SUPPLIER_ID_FIELD,
 )
 from ecommerce_integrations.shopify.utils import (
     ensure_old_connector_is_disabled,
     migrate_from_old_connector,
 )
-from ecommerce_integrations.shopify.sync_customers import ShopifyCustomer
 
 
 class ShopifySetting(SettingController):
@@ -48,8 +48,12 @@ class ShopifySetting(SettingController):
         self._validate_warehouse_links()
         self._initalize_default_values()
 
-        if self.is_enabled():
+        # custom fields only need (re)creating when their definitions changed or one was deleted
+        if self.is_enabled() and (
+            self.custom_fields_hash != CUSTOM_FIELDS_HASH or custom_fields_missing()
+        ):
             setup_custom_fields()
+            self.custom_fields_hash = CUSTOM_FIELDS_HASH
 
     def on_update(self):
         if self.is_enabled() and not self.is_old_data_migrated:
@@ -85,20 +89,22 @@ class ShopifySetting(SettingController):
             self.last_inventory_sync = get_datetime("1970-01-01")
 
     @frappe.whitelist()
-    @connection.temp_shopify_session
     def update_location_table(self):
         """Fetch locations from Shopify and add them to the child table so the user can
         map them with the correct ERPNext warehouse."""
+        if not self.is_enabled():
+            frappe.throw(_("Shopify integration is not enabled."))
+
+        locations = connection.get_shopify_locations(self.shopify_url, self.get_password("password"))
+
         self.shopify_warehouse_mapping = []
-        for locations in PaginatedIterator(Location.find()):
-            for location in locations:
-                self.append(
-                    "shopify_warehouse_mapping",
-                    {
-                        "shopify_location_id": location.id,
-                        "shopify_location_name": location.name,
-                    },
-                )
+        self.extend(
+            "shopify_warehouse_mapping",
+            [
+                {"shopify_location_id": location.id, "shopify_location_name": location.name}
+                for location in locations
+            ],
+        )
 
     def get_erpnext_warehouses(self) -> list[ERPNextWarehouse]:
         return [wh_map.erpnext_warehouse for wh_map in self.shopify_warehouse_mapping]
@@ -120,8 +126,8 @@ class ShopifySetting(SettingController):
         }
 
 
-def setup_custom_fields():
-    custom_fields = {
+def get_custom_fields() -> dict:
+    return {
         "Item": [
             dict(
                 fieldname=ITEM_SELLING_RATE_FIELD,
@@ -132,14 +138,23 @@ def setup_custom_fields():
         ],
         "Customer": [
             dict(
-                fieldname="custom_shopify_customer_id",
+                fieldname=CUSTOMER_ID_FIELD,
                 label="Shopify Customer ID",
                 fieldtype="Data",
                 insert_after="customer_name",
                 read_only=1,
                 print_hide=1,
-                unique=1,  # Ensure uniqueness to prevent duplicates
-            )
+                unique=1,  # also indexes the column used to match Shopify records
+            ),
+            dict(
+                fieldname=PAYLOAD_HASH_FIELD,
+                label="Shopify Payload Hash",
+                fieldtype="Data",
+                insert_after=CUSTOMER_ID_FIELD,
+                read_only=1,
+                hidden=1,
+                print_hide=1,
+            ),
         ],
         "Supplier": [
             dict(
@@ -153,14 +168,23 @@ def setup_custom_fields():
         ],
         "Address": [
             dict(
-                fieldname="shopify_address_id",
+                fieldname=ADDRESS_ID_FIELD,
                 label="Shopify Address ID",
                 fieldtype="Data",
                 insert_after="address_title",
                 read_only=1,
                 print_hide=1,
-                unique=1,  # Ensure uniqueness to prevent duplicates
-            )
+                unique=1,  # also indexes the column used to match Shopify records
+            ),
+            dict(
+                fieldname=PAYLOAD_HASH_FIELD,
+                label="Shopify Payload Hash",
+                fieldtype="Data",
+                insert_after=ADDRESS_ID_FIELD,
+                read_only=1,
+                hidden=1,
+                print_hide=1,
+            ),
         ],
         "Sales Order": [
             dict(
@@ -259,17 +283,37 @@ def setup_custom_fields():
         ],
     }
 
-    create_custom_fields(custom_fields)
+
+def setup_custom_fields():
+    create_custom_fields(get_custom_fields())
+
+
+CUSTOM_FIELDS_HASH = hashlib.md5(repr(get_custom_fields()).encode()).hexdigest()
+
+
+def custom_fields_missing() -> bool:
+    names = {
+        f"{doctype}-{field['fieldname']}"
+        for doctype, fields in get_custom_fields().items()
+        for field in fields
+    }
+    return frappe.db.count("Custom Field", {"name": ("in", list(names))}) < len(names)
 
 
-# Added the import_all_customers function below
 @frappe.whitelist()
 def import_all_customers():
+    job_name = "Shopify Customer Import"
+    if frappe.db.get_all("RQ Job", {"job_name": job_name, "status": ["in", ["queued", "started"]]}):
+        return frappe.msgprint(_("Customer import is already running in the background."))
+
     try:
-        enqueue(sync_all_customers, queue='long', timeout=6000)
+        enqueue(
+            "ecommerce_integrations.shopify.sync_customers.enqueue_shopify_customer_pages",
+            queue="long",
+            timeout=6000,
+            job_name=job_name,
+        )
         frappe.msgprint(_("Customer import has been initiated in the background."))
     except Exception as e:
         frappe.log_error(message=str(e), title="Shopify Customer Import Error")
         frappe.throw(_("An error occurred while importing customers: {0}").format(str(e)))
-
-
@@ -0,0 +1,196 @@
+# Copyright (c) 2021, Frappe and contributors
+# For license information, please see LICENSE
+
+"""Full exports using Shopify's GraphQL Bulk Operations API.
+
+A bulk operation runs the query on Shopify's side and returns the whole result set as a
+single JSONL file, which replaces hundreds of paginated REST calls for large stores.
+
+ref: https://shopify.dev/docs/api/usage/bulk-operations/queries
+"""
+
+import re
+import time
+from collections.abc import Iterator
+from typing import Any
+
+import frappe
+import orjson
+from frappe import _
+from frappe.utils import get_datetime, get_system_timezone
+from pytz import timezone
+
+from ecommerce_integrations.shopify.connection import _SESSION, _get_auth_details, graphql_request
+
+# seconds to wait between polls of a running bulk operation
+POLL_INTERVAL = 10
+
+# seconds a bulk operation may run before it is canceled, kept below the timeout of the
+# customer import job (6000s) so the result can still be streamed and enqueued
+BULK_OPERATION_TIMEOUT = 4500
+
+# bytes read from the socket at a time while streaming bulk operation results
+RESULT_CHUNK_SIZE = 64 * 1024
+
+BULK_OPERATION_FINISHED = ("COMPLETED", "FAILED", "CANCELED", "EXPIRED")
+
+# `filter` is either empty or a `(query: "...")` search argument
+CUSTOMERS_QUERY = """
+{
+	customers%(filter)s {
+		edges {
+			node {
+				legacyResourceId
+				firstName
+				lastName
+				email
+				phone
+				updatedAt
+				defaultAddress { id }
+				addresses { id address1 address2 city province zip country countryCodeV2 phone }
+			}
+		}
+	}
+}
+"""
+
+RUN_BULK_QUERY = """
+mutation($query: String!) {
+	bulkOperationRunQuery(query: $query) {
+		bulkOperation { id status }
+		userErrors { field message }
+	}
+}
+"""
+
+CURRENT_BULK_OPERATION = """
+{
+	currentBulkOperation { id status errorCode url }
+}
+"""
+
+CANCEL_BULK_OPERATION = """
+mutation($id: ID!) {
+	bulkOperationCancel(id: $id) {
+		bulkOperation { id status }
+		userErrors { field message }
+	}
+}
+"""
+
+_LEGACY_ID_RE = re.compile(r"/(\d+)(?:\?|$)")
+
+
+def bulk_export_customers(updated_after=None) -> Iterator[dict[str, Any]]:
+	"""Yield Shopify customers, shaped like REST `customers.json` entries.
+
+	If `updated_after` is set, only customers created or updated since then are exported."""
+	customer_filter = ""
+	if updated_after:
+		customer_filter = f"(query: \"updated_at:>='{_utc_timeformat(updated_after)}'\")"
+
+	for node in run_bulk_query(CUSTOMERS_QUERY % {"filter": customer_filter}):
+		yield _to_rest_customer(node)
+
+
+def run_bulk_query(query: str) -> Iterator[dict[str, Any]]:
+	"""Start a bulk operation for `query`, wait for it to finish and stream its JSONL result."""
+	shopify_url, password = _get_auth_details()
+
+	response = graphql_request(shopify_url, password, RUN_BULK_QUERY, variables={"query": query})
+	result = _get_data(response)["bulkOperationRunQuery"]
+	if result["userErrors"]:
+		frappe.throw(_("Shopify bulk operation failed: {0}").format(result["userErrors"]))
+
+	operation = _wait_for_bulk_operation(shopify_url, password)
+	if operation["status"] != "COMPLETED":
+		frappe.throw(
+			_("Shopify bulk operation {0}: {1}").format(operation["status"], operation.get("errorCode"))
+		)
+
+	if not operation.get("url"):  # no results
+		return
+
+	with _SESSION.get(operation["url"], stream=True) as result_file:
+		result_file.raise_for_status()
+		# only one chunk and the current line are held in memory, the default 512 byte
+		# chunks would make a Python-level call for every few records
+		for line in result_file.iter_lines(chunk_size=RESULT_CHUNK_SIZE):
+			if line:
+				yield orjson.loads(line)
+
+
+def _wait_for_bulk_operation(shopify_url: str, password: str) -> dict[str, Any]:
+	deadline = time.monotonic() + BULK_OPERATION_TIMEOUT
+	while True:
+		operation = _get_data(graphql_request(shopify_url, password, CURRENT_BULK_OPERATION))[
+			"currentBulkOperation"
+		]
+		if operation["status"] in BULK_OPERATION_FINISHED:
+			return operation
+
+		if time.monotonic() >= deadline:
+			# only one bulk query can run per shop, a forgotten one blocks the next sync
+			graphql_request(shopify_url, password, CANCEL_BULK_OPERATION, variables={"id": operation["id"]})
+			frappe.throw(
+				_("Shopify bulk operation {0} did not finish within {1} seconds and was canceled.").format(
+					operation["id"], BULK_OPERATION_TIMEOUT
+				)
+			)
+
+		time.sleep(POLL_INTERVAL)
+
+
+def _get_data(response) -> dict[str, Any]:
+	if response.status_code != 200:
+		frappe.throw(_("Shopify GraphQL request failed: {0}").format(response.text))
+
+	body = orjson.loads(response.content)
+	if body.get("errors"):
+		frappe.throw(_("Shopify GraphQL request failed: {0}").format(body["errors"]))
+
+	return body["data"]
+
+
+def _to_rest_customer(node: dict[str, Any]) -> dict[str, Any]:
+	default_address = (node.get("defaultAddress") or {}).get("id")
+
+	return {
+		"id": int(node["legacyResourceId"]),
+		"first_name": node.get("firstName"),
+		"last_name": node.get("lastName"),
+		"email": node.get("email"),
+		"phone": node.get("phone"),
+		"updated_at": node.get("updatedAt"),
+		"addresses": [
+			{
+				"id": _legacy_id(address["id"]),
+				"default": address["id"] == default_address,
+				"address1": address.get("address1"),
+				"address2": address.get("address2"),
+				"city": address.get("city"),
+				"province": address.get("province"),
+				"zip": address.get("zip"),
+				"country": address.get("country"),
+				"country_code": address.get("countryCodeV2"),
+				"phone": address.get("phone"),
+			}
+			for address in node.get("addresses") or []
+		],
+	}
+
+
+def _utc_timeformat(datetime) -> str:
+	datetime = get_datetime(datetime)
+	# naive values like now_datetime() are in the system timezone, astimezone would read them
+	# as the timezone of the server OS instead
+	if not datetime.tzinfo:
+		datetime = timezone(get_system_timezone()).localize(datetime)
+
+	return datetime.astimezone(timezone("UTC")).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _legacy_id(gid: str) -> int | None:
+	"""Numeric REST id from a GraphQL global id like gid://shopify/MailingAddress/1?model_name=..."""
+	match = _LEGACY_ID_RE.search(gid or "")
+	return int(match.group(1)) if match else None
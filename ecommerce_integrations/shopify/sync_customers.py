@@ -1,207 +1,568 @@
-from typing import Optional
+import functools
+import hashlib
+import re
 
 import frappe
-from frappe import _
-from shopify.resources import Customer
+import orjson
+from frappe.utils import cstr, get_datetime, now_datetime
 import phonenumbers
 
-from ecommerce_integrations.shopify.connection import temp_shopify_session, get_shopify_customers
-from ecommerce_integrations.shopify.constants import SETTING_DOCTYPE, MODULE_NAME
-from ecommerce_integrations.shopify.utils import create_shopify_log
-
-
-class ShopifyCustomer:
-    def __init__(self, customer_id: str):
-        self.customer_id = str(customer_id)
-        self.setting = frappe.get_doc(SETTING_DOCTYPE)
-
-        if not self.setting.is_enabled():
-            frappe.throw(_("Cannot create Shopify customer when integration is disabled."))
-
-    def is_synced(self) -> bool:
-        return frappe.db.exists("Customer", {"shopify_customer_id": self.customer_id})
-
-    def get_erpnext_customer(self):
-        return frappe.get_doc("Customer", {"shopify_customer_id": self.customer_id})
-
-    @temp_shopify_session
-    def sync_customer(self):
-        if not self.is_synced():
-            shopify_customer = Customer.find(self.customer_id)
-            customer_dict = shopify_customer.to_dict()
-            self._make_customer(customer_dict)
-
-    def _make_customer(self, customer_dict):
-        customer_name = f"{customer_dict.get('first_name', '')} {customer_dict.get('last_name', '')}".strip()
-        email = customer_dict.get('email')
-        phone = customer_dict.get('phone')
-
-        customer_doc = frappe.get_doc({
-            "doctype": "Customer",
-            "customer_name": customer_name or email or phone,
-            "shopify_customer_id": self.customer_id,
-            "email_id": email,
-            "phone": phone,
-            "customer_group": "All Customer Groups",
-            "territory": "All Territories",
-        })
+from ecommerce_integrations.shopify.shopify_bulk import bulk_export_customers
+from ecommerce_integrations.shopify.constants import (
+    CUSTOMER_ID_FIELD,
+    PAYLOAD_HASH_FIELD,
+    SETTING_DOCTYPE,
+)
 
-        customer_doc.flags.ignore_mandatory = True
-        customer_doc.insert(ignore_permissions=True)
+# customers written per transaction during a full sync
+CUSTOMER_BATCH_SIZE = 500
 
-        create_shopify_log(
-            status="Success",
-            request_data=customer_dict,
-            message=f"Customer {customer_name} imported successfully.",
-            method="sync_customer",
-        )
+# Shopify Setting field holding when the last customer sync without failures started
+LAST_SYNC_FIELD = "last_customer_sync"
+# seconds the pending batch counter and failure flag of a sync run are kept in redis,
+# a run whose batches have not all finished by then never advances LAST_SYNC_FIELD
+SYNC_RUN_TTL = 24 * 60 * 60
+
+# plainly formatted US/NANP numbers, the bulk of Shopify phones, formatted without phonenumbers
+_US_PHONE_RE = re.compile(r"^(?:\+1|1)?[\s().-]*(\d{3})[\s().-]*(\d{3})[\s.-]*(\d{4})$")
+
+# rows per multi-row UPDATE statement, keeps it below max_allowed_packet
+UPDATE_CHUNK_SIZE = 1000
+
+
+def enqueue_shopify_customer_pages():
+    """Walk all Shopify customers and enqueue one sync job per batch.
 
+    Batches are small independent jobs, so a failure only affects its own batch and
+    batches are synced in parallel by the available workers. Only customers updated since
+    the last sync without failures are exported, the last job of a run to finish advances
+    that point if no job of the run failed."""
+    started = now_datetime()
+    run_id = frappe.generate_hash(length=10)
+    # the coordinator holds one pending part itself so batches finishing early cannot end the run
+    _start_customer_sync(run_id)
 
-@frappe.whitelist()
-def import_all_customers():
+    failed = True
     try:
-        # Corrected to properly reference the class method ShopifyCustomer.sync_all_customers
-        enqueue(ShopifyCustomer.sync_all_customers, queue='long', timeout=6000)
-        frappe.msgprint(_("Customer import has been initiated in the background."))
-    except Exception as e:
-        frappe.log_error(message=str(e), title="Shopify Customer Import Error")
-        frappe.throw(_("An error occurred while importing customers: {0}").format(str(e)))
+        batch = []
+        for customer_data in bulk_export_customers(updated_after=_get_last_customer_sync()):
+            batch.append(customer_data)
+            if len(batch) >= CUSTOMER_BATCH_SIZE:
+                _enqueue_customer_batch(run_id, started, batch)
+                batch = []
+
+        if batch:
+            _enqueue_customer_batch(run_id, started, batch)
+        failed = False
+    finally:
+        _finish_customer_sync_part(run_id, started, failed)
+
+
+def _enqueue_customer_batch(run_id: str, started, customers: list[dict]) -> None:
+    frappe.cache().incr(_get_sync_run_key(run_id, "pending"))
+    frappe.enqueue(
+        "ecommerce_integrations.shopify.sync_customers.sync_customer_batch",
+        queue="default",
+        timeout=600,
+        # not deduplicated, a batch of a later sync carries newer data for the same customers
+        job_id=f"shopify-customers-{run_id}-{customers[0]['id']}",
+        customers=customers,
+        run_id=run_id,
+        started=started,
+    )
+
+
+def sync_customer_batch(customers: list[dict], run_id: str, started) -> None:
+    """Background job syncing one batch of Shopify customer dicts."""
+    failed = True
+    try:
+        failed = bool(_sync_customer_batch(customers))
+    finally:
+        _finish_customer_sync_part(run_id, started, failed)
+
 
+def _sync_customer_batch(customers: list[dict]) -> int:
+    """Upsert one batch of customers in a single transaction, returns number of failed customers.
 
-@temp_shopify_session
-def sync_all_customers():
-    """Fetches and syncs all customers from Shopify."""
+    If the batch fails, its customers are retried one per transaction so that a single bad
+    customer does not fail the others."""
+    customers = _latest_by_id(customers)
     try:
-        customers = get_shopify_customers()  # Initial fetch
-        total_customers = len(customers)
-        imported = 0
-        failed = 0
-
-        for customer_data in customers:
-            customer_id = customer_data.get('id', 'Unknown ID')
-            try:
-                customer_instance = ShopifyCustomer(customer_id)
-                customer_instance.sync_customer()
-                imported += 1
-            except Exception as e:
-                failed += 1
-                frappe.log_error(
-                    f"Error syncing customer {customer_id}: {frappe.get_traceback()}",
-                    'Shopify Customer Import Error'
-                )
-                continue
-
-        frappe.msgprint(
-            _(f"Customer synchronization completed: {imported} imported, {failed} failed out of {total_customers}."),
-            title=_("Synchronization Summary"),
-            indicator="green" if failed == 0 else "orange"
-        )
+        _upsert_customers(customers)
+        frappe.db.commit()
+        return 0
+    except Exception:
+        frappe.db.rollback()
+
+    errors = []
+    for customer_data in customers:
+        try:
+            _upsert_customers([customer_data])
+            frappe.db.commit()
+        except Exception:
+            frappe.db.rollback()
+            errors.append(f"Customer {customer_data.get('id')}: {frappe.get_traceback()}")
 
-    except Exception as e:
-        frappe.log_error(f"Failed to fetch customers from Shopify: {frappe.get_traceback()}", 'Shopify Customer Sync Error')
-        frappe.throw(f"Error syncing customers from Shopify: {e}")
+    if errors:
+        frappe.log_error("\n\n".join(errors), 'Shopify Customer Import Error')
 
+    return len(errors)
 
-def handle_customer_addresses(customer, customer_data):
-    """
-    Creates or updates addresses for the given customer.
-    """
-    addresses = customer_data.get('addresses', [])
-    for address_data in addresses:
-        create_or_update_address(customer, address_data)
 
+def _upsert_customers(customers: list[dict]) -> None:
+    customers_by_id = batch_upsert_customers(customers)
+    countries = _get_countries()
 
-def create_or_update_address(customer, address_data):
-    """
-    Creates or updates an address based on the Shopify Address ID.
-    """
-    try:
-        shopify_address_id = str(address_data.get('id'))
+    addresses = []
+    contacts = []
+    for customer_data in customers:
+        customer = customers_by_id[str(customer_data["id"])]
+        if customer.unchanged:
+            continue
+        addresses.extend(_get_address_rows(customer, customer_data, countries))
+        contacts.append((customer, customer_data))
 
-        existing_address_name = frappe.db.get_value(
-            'Address', {'shopify_address_id': shopify_address_id}, 'name'
-        )
+    batch_upsert_addresses(addresses)
+    batch_upsert_contacts(contacts)
+
+
+def _get_sync_run_key(run_id: str, key: str) -> str:
+    return frappe.cache().make_key(f"shopify_customer_sync|{run_id}|{key}")
+
+
+def _start_customer_sync(run_id: str) -> None:
+    frappe.cache().set(_get_sync_run_key(run_id, "pending"), 1, ex=SYNC_RUN_TTL)
+
+
+def _finish_customer_sync_part(run_id: str, started, failed: bool) -> None:
+    """Mark the coordinator or one batch job of a sync run as finished.
+
+    Once every part of the run has finished without failures the next sync only needs
+    customers updated after `started`. Parts that never finish, like jobs killed by their
+    timeout, keep the run pending so it never advances LAST_SYNC_FIELD."""
+    cache = frappe.cache()
+    failed_key = _get_sync_run_key(run_id, "failed")
+    if failed:
+        cache.set(failed_key, 1, ex=SYNC_RUN_TTL)
+
+    if cache.decr(_get_sync_run_key(run_id, "pending")) == 0 and not cache.get(failed_key):
+        _set_last_customer_sync(started)
+
+
+def _get_last_customer_sync():
+    return frappe.db.get_single_value(SETTING_DOCTYPE, LAST_SYNC_FIELD)
 
-        address_fields = {
-            'doctype': 'Address',
-            'shopify_address_id': shopify_address_id,
-            'address_title': customer.customer_name,
-            'address_type': 'Billing' if address_data.get('default') else 'Shipping',
-            'address_line1': address_data.get('address1') or '',
-            'address_line2': address_data.get('address2') or '',
-            'city': address_data.get('city') or '',
-            'state': address_data.get('province') or '',
-            'pincode': address_data.get('zip') or '',
-            'country': address_data.get('country') or '',
-            'phone': address_data.get('phone') or '',
-            'email_id': customer.email_id,
-            'links': [{
-                'link_doctype': 'Customer',
-                'link_name': customer.name
-            }]
-        }
 
-        if existing_address_name:
-            address = frappe.get_doc('Address', existing_address_name)
-            address.update(address_fields)
+def _set_last_customer_sync(started) -> None:
+    # runs can finish out of order, an older run never moves the watermark back
+    last_sync = _get_last_customer_sync()
+    if not last_sync or get_datetime(last_sync) < get_datetime(started):
+        frappe.db.set_single_value(SETTING_DOCTYPE, LAST_SYNC_FIELD, started)
+
+
+def _latest_by_id(customers: list[dict]) -> list[dict]:
+    """Drop customers repeated within a batch, keeping the most recently updated copy.
+
+    Repeats across batches are skipped by the payload hash instead."""
+    latest = {}
+    for customer_data in customers:
+        customer_id = str(customer_data["id"])
+        current = latest.get(customer_id)
+        if not current or cstr(customer_data.get("updated_at")) >= cstr(current.get("updated_at")):
+            latest[customer_id] = customer_data
+
+    return list(latest.values())
+
+
+def batch_upsert_customers(customers: list[dict]) -> dict[str, frappe._dict]:
+    """Create or update ERPNext customers for a batch of Shopify customer dicts.
+
+    Existing customers are looked up with one query and new ones are written with one
+    multi-row insert. Customers whose payload hash matches the last sync are marked
+    `unchanged` and skipped, all other existing customers are updated with one upsert.
+    Returns ERPNext customer (name, customer_name, email_id, unchanged) by Shopify customer ID."""
+    if not customers:
+        return {}
+
+    customer_ids = [str(c["id"]) for c in customers]
+    existing = {
+        d[CUSTOMER_ID_FIELD]: d
+        for d in frappe.get_all(
+            "Customer",
+            filters={CUSTOMER_ID_FIELD: ("in", customer_ids)},
+            fields=["name", CUSTOMER_ID_FIELD, "customer_name", "email_id", PAYLOAD_HASH_FIELD],
+        )
+    }
+
+    customers_by_id = {}
+    to_insert = []
+    to_update = []
+
+    for customer_data in customers:
+        customer_id = str(customer_data["id"])
+        payload_hash = _payload_hash(customer_data)
+        customer = existing.get(customer_id)
+
+        if customer and customer.get(PAYLOAD_HASH_FIELD) == payload_hash:
+            customer.unchanged = True
+            customers_by_id[customer_id] = customer
+            continue
+
+        customer_name = _get_customer_name(customer_data)
+        email = customer_data.get("email")
+        # Customer has no phone column, its mobile_no is what the customer list shows
+        mobile_no = _normalize_phone(customer_data.get("phone")) or customer_data.get("phone")
+
+        if not customer:
+            # Shopify customer ID as document name, same as EcommerceCustomer.sync_customer
+            customer = frappe._dict(name=customer_id)
+            to_insert.append({
+                "name": customer_id,
+                CUSTOMER_ID_FIELD: customer_id,
+                "customer_name": customer_name,
+                "email_id": email,
+                "mobile_no": mobile_no,
+                "customer_type": "Individual",
+                "customer_group": "All Customer Groups",
+                "territory": "All Territories",
+                PAYLOAD_HASH_FIELD: payload_hash,
+            })
         else:
-            address = frappe.get_doc(address_fields)
-
-        address.flags.ignore_mandatory = True
-        address.save(ignore_permissions=True)
-    except Exception as e:
-        frappe.log_error(
-            f"Error importing address for customer {customer.name}: {frappe.get_traceback()}",
-            'Shopify Address Import Error'
+            to_update.append({
+                "name": customer.name,
+                "customer_name": customer_name,
+                "email_id": email,
+                "mobile_no": mobile_no,
+                PAYLOAD_HASH_FIELD: payload_hash,
+            })
+
+        customer.customer_name = customer_name
+        customer.email_id = email
+        customer.unchanged = False
+        customers_by_id[customer_id] = customer
+
+    _bulk_insert("Customer", to_insert)
+    _bulk_update("Customer", to_update)
+    return customers_by_id
+
+
+def _payload_hash(data: dict) -> str:
+    return hashlib.blake2b(
+        orjson.dumps(data, option=orjson.OPT_SORT_KEYS, default=str), digest_size=16
+    ).hexdigest()
+
+
+def _get_customer_name(customer_dict: dict) -> str:
+    customer_name = f"{cstr(customer_dict.get('first_name'))} {cstr(customer_dict.get('last_name'))}".strip()
+    return customer_name or customer_dict.get('email') or customer_dict.get('phone')
+
+
+def _get_address_rows(customer, customer_data, countries: dict[str, str]) -> list[tuple[str, dict]]:
+    return [
+        (customer.name, _map_address_fields(customer, address_data, countries))
+        for address_data in customer_data.get('addresses') or []
+    ]
+
+
+def _get_countries() -> dict[str, str]:
+    """ERPNext Country names by lower-cased ISO code and by lower-cased name."""
+    countries = {}
+    for name, code in frappe.get_all('Country', fields=['name', 'code'], as_list=True):
+        countries[name.lower()] = name
+        if code:
+            countries[code.lower()] = name
+    return countries
+
+
+def _get_country(address_data, countries: dict[str, str]) -> str:
+    # bulk inserts skip link validation, an unknown country is left empty instead
+    for value in (address_data.get('country_code'), address_data.get('country')):
+        if value and (country := countries.get(value.lower())):
+            return country
+    return ''
+
+
+def _map_address_fields(customer, address_data, countries: dict[str, str]) -> dict:
+    return {
+        'shopify_address_id': str(address_data.get('id')),
+        'address_title': customer.customer_name,
+        'address_type': 'Billing' if address_data.get('default') else 'Shipping',
+        'address_line1': address_data.get('address1') or '',
+        'address_line2': address_data.get('address2') or '',
+        'city': address_data.get('city') or '',
+        'state': address_data.get('province') or '',
+        'pincode': address_data.get('zip') or '',
+        'country': _get_country(address_data, countries),
+        'phone': address_data.get('phone') or '',
+        'email_id': customer.email_id,
+    }
+
+
+def batch_upsert_addresses(addresses: list[tuple[str, dict]]) -> None:
+    """Create or update addresses from (customer name, address fields) pairs.
+
+    Existing addresses are matched on Shopify Address ID with one query and rewritten only
+    if the hash of their fields changed, new addresses and their customer links are bulk
+    inserted."""
+    if not addresses:
+        return
+
+    # the same address can be listed more than once, last one wins
+    addresses = list({fields['shopify_address_id']: (customer, fields) for customer, fields in addresses}.values())
+    address_ids = [fields['shopify_address_id'] for _customer, fields in addresses]
+    existing = {
+        d.shopify_address_id: d
+        for d in frappe.get_all(
+            'Address',
+            filters={'shopify_address_id': ('in', address_ids)},
+            fields=['name', 'shopify_address_id', PAYLOAD_HASH_FIELD],
         )
-        frappe.throw(f"Error importing address: {e}")
+    }
+
+    to_insert = []
+    to_update = []
+    links = {}
+    for customer, fields in addresses:
+        fields = {**fields, PAYLOAD_HASH_FIELD: _payload_hash(fields)}
+        address = existing.get(fields['shopify_address_id'])
+        if address:
+            if address.get(PAYLOAD_HASH_FIELD) != fields[PAYLOAD_HASH_FIELD]:
+                to_update.append({'name': address.name, **fields})
+            continue
+
+        name = frappe.generate_hash(length=10)
+        to_insert.append({'name': name, **fields})
+        links[name] = _get_customer_link(name, 'Address', customer)
+
+    _bulk_insert('Address', to_insert)
+    inserted = _get_inserted('Address', to_insert)
+    _bulk_update('Address', to_update)
+    _bulk_insert('Dynamic Link', [link for name, link in links.items() if name in inserted])
+
+
+def batch_upsert_contacts(contacts: list[tuple]) -> None:
+    """Create or update contacts from (customer, Shopify customer dict) pairs, matched on phone.
+
+    Customers without a valid phone number are skipped, invalid numbers are reported in
+    one Error Log for the whole batch."""
+    rows = {}
+    invalid_phones = []
+    for customer, customer_data in contacts:
+        phone = _normalize_phone(customer_data.get('phone'))
+        if not phone:
+            if customer_data.get('phone'):
+                invalid_phones.append(f"{customer.name}: {customer_data['phone']}")
+            continue
+
+        first_name = customer_data.get('first_name') or customer.customer_name
+        last_name = customer_data.get('last_name') or ''
+        rows[phone] = (customer, {
+            'first_name': first_name,
+            'last_name': last_name,
+            # set by Contact.validate, which bulk writes bypass
+            'full_name': _get_full_name(first_name, last_name),
+            'phone': phone,
+            'email_id': customer_data.get('email'),
+        })
 
+    if invalid_phones:
+        frappe.log_error("\n".join(invalid_phones), "Shopify Contact Import Warning")
 
-def handle_customer_contacts(customer, customer_data):
-    """
-    Creates or updates a contact based on the phone number.
-    """
-    phone = customer_data.get('phone')
+    if not rows:
+        return
 
-    try:
-        if not phone:
-            frappe.log_error(
-                f"Customer {customer.name} has no phone number. Skipping contact creation.",
-                "Shopify Contact Import Warning"
+    existing = {
+        d.phone: d
+        for d in frappe.get_all(
+            'Contact',
+            filters={'phone': ('in', list(rows))},
+            fields=['name', 'first_name', 'last_name', 'full_name', 'phone', 'email_id'],
+        )
+    }
+    existing_links = set()
+    if existing:
+        existing_links = {
+            (d.parent, d.link_name)
+            for d in frappe.get_all(
+                'Dynamic Link',
+                filters={
+                    'parenttype': 'Contact',
+                    'link_doctype': 'Customer',
+                    'parent': ('in', [d.name for d in existing.values()]),
+                },
+                fields=['parent', 'link_name'],
             )
-            return
-
-        try:
-            parsed_phone = phonenumbers.parse(phone, "US")
-            phone = phonenumbers.format_number(parsed_phone, phonenumbers.PhoneNumberFormat.E164)
-        except phonenumbers.NumberParseException:
-            frappe.log_error(f"Invalid phone number format for customer {customer.name}: {phone}", "Shopify Contact Import Warning")
-            return
-
-        existing_contact_name = frappe.db.get_value('Contact', {'phone': phone}, 'name')
-
-        contact_fields = {
-            'doctype': 'Contact',
-            'first_name': customer_data.get('first_name') or customer.customer_name,
-            'last_name': customer_data.get('last_name') or '',
-            'phone': phone,
-            'links': [{'link_doctype': 'Customer', 'link_name': customer.name}]
         }
 
-        if customer_data.get('email'):
-            contact_fields['email_id'] = customer_data.get('email')
+    to_insert = []
+    to_update = []
+    primary_emails = {}
+    children = {}
+    links = []
+    for phone, (customer, fields) in rows.items():
+        contact = existing.get(phone)
+        if contact:
+            # blank Shopify values never overwrite what is already on the contact
+            values = {k: v or contact.get(k) for k, v in fields.items()}
+            values['full_name'] = _get_full_name(values['first_name'], values['last_name'])
+            if any(contact.get(k) != v for k, v in values.items()):
+                to_update.append({'name': contact.name, **values})
+            # phone is the match key and never changes, a new email needs its child row as well
+            if values['email_id'] and values['email_id'] != contact.email_id:
+                primary_emails[contact.name] = values['email_id']
+            if (contact.name, customer.name) not in existing_links:
+                links.append(_get_customer_link(contact.name, 'Contact', customer.name))
+            continue
+
+        name = frappe.generate_hash(length=10)
+        to_insert.append({'name': name, 'status': 'Passive', **fields})
+        children[name] = (
+            _get_child_row(name, 'Contact', 'phone_nos', phone=phone, is_primary_phone=1),
+            fields['email_id']
+            and _get_child_row(name, 'Contact', 'email_ids', email_id=fields['email_id'], is_primary=1),
+            _get_customer_link(name, 'Contact', customer.name),
+        )
 
-        if existing_contact_name:
-            contact = frappe.get_doc('Contact', existing_contact_name)
-            contact.update(contact_fields)
-        else:
-            contact = frappe.get_doc(contact_fields)
-
-        contact.flags.ignore_mandatory = True
-        contact.save(ignore_permissions=True)
-    except Exception as e:
-        frappe.log_error(
-            f"Error importing contact for customer {customer.name}: {frappe.get_traceback()}",
-            'Shopify Contact Import Error'
+    _bulk_insert('Contact', to_insert)
+    inserted = _get_inserted('Contact', to_insert)
+    _bulk_update('Contact', to_update)
+    _set_primary_emails(primary_emails)
+
+    phone_nos = []
+    email_ids = []
+    for name, (phone_no, email_id, link) in children.items():
+        if name not in inserted:
+            continue
+        phone_nos.append(phone_no)
+        if email_id:
+            email_ids.append(email_id)
+        links.append(link)
+
+    _bulk_insert('Contact Phone', phone_nos)
+    _bulk_insert('Contact Email', email_ids)
+    _bulk_insert('Dynamic Link', links)
+
+
+def _set_primary_emails(emails: dict[str, str]) -> None:
+    """Make each email the primary Contact Email of its existing contact, by Contact name.
+
+    Contact.validate copies the primary row into Contact.email_id, so a changed email_id
+    without its row would be switched back by the next save of the contact."""
+    if not emails:
+        return
+
+    rows = frappe.get_all(
+        'Contact Email',
+        filters={'parenttype': 'Contact', 'parent': ('in', list(emails))},
+        fields=['name', 'parent', 'email_id', 'is_primary', 'idx'],
+    )
+    existing = {(row.parent, row.email_id): row.name for row in rows}
+    last_idx = {}
+    for row in rows:
+        last_idx[row.parent] = max(last_idx.get(row.parent, 0), row.idx)
+
+    to_update = [
+        {'name': row.name, 'is_primary': 0}
+        for row in rows
+        if row.is_primary and emails[row.parent] != row.email_id
+    ]
+    to_insert = []
+    for contact, email_id in emails.items():
+        if name := existing.get((contact, email_id)):
+            to_update.append({'name': name, 'is_primary': 1})
+            continue
+
+        row = _get_child_row(contact, 'Contact', 'email_ids', email_id=email_id, is_primary=1)
+        row['idx'] = last_idx.get(contact, 0) + 1
+        to_insert.append(row)
+
+    _bulk_update('Contact Email', to_update)
+    _bulk_insert('Contact Email', to_insert)
+
+
+def _get_full_name(first_name: str, last_name: str) -> str:
+    return " ".join(filter(None, [cstr(first_name).strip(), cstr(last_name).strip()]))
+
+
+# the same numbers come back on every re-sync and are often shared between accounts
+@functools.lru_cache(maxsize=100_000)
+def _normalize_phone(phone: str | None) -> str | None:
+    """Return phone in E164 format, None if missing or invalid."""
+    if not phone:
+        return None
+
+    if match := _US_PHONE_RE.match(phone):
+        return "+1" + "".join(match.groups())
+
+    try:
+        parsed_phone = phonenumbers.parse(phone, "US")
+        return phonenumbers.format_number(parsed_phone, phonenumbers.PhoneNumberFormat.E164)
+    except phonenumbers.NumberParseException:
+        return None
+
+
+def _get_customer_link(parent: str, parenttype: str, customer: str) -> dict:
+    return _get_child_row(parent, parenttype, 'links', link_doctype='Customer', link_name=customer)
+
+
+def _get_child_row(parent: str, parenttype: str, parentfield: str, **fields) -> dict:
+    return {
+        'name': frappe.generate_hash(length=10),
+        'parent': parent,
+        'parenttype': parenttype,
+        'parentfield': parentfield,
+        'idx': 1,
+        **fields,
+    }
+
+
+def _bulk_insert(doctype: str, rows: list[dict]) -> None:
+    """Insert rows sharing the same keys (including `name`) with one multi-row INSERT.
+
+    Document controllers are bypassed, only standard audit columns are filled in. Rows
+    clashing with a unique key are skipped, see `_get_inserted`."""
+    if not rows:
+        return
+
+    now = now_datetime()
+    user = frappe.session.user
+    frappe.db.bulk_insert(
+        doctype,
+        fields=[*rows[0], 'creation', 'modified', 'owner', 'modified_by'],
+        values=[(*row.values(), now, now, user, user) for row in rows],
+        ignore_duplicates=True,
+    )
+
+
+def _get_inserted(doctype: str, rows: list[dict]) -> set[str]:
+    """Names of `rows` present after `_bulk_insert`, child rows are only added for these."""
+    if not rows:
+        return set()
+
+    return set(frappe.get_all(doctype, filters={'name': ('in', [row['name'] for row in rows])}, pluck='name'))
+
+
+def _bulk_update(doctype: str, rows: list[dict]) -> None:
+    """Update existing documents from rows sharing the same keys, including `name`.
+
+    Every UPDATE_CHUNK_SIZE rows are written with one UPDATE setting each field through a
+    CASE on `name`. Only the listed names are matched, a document deleted in the meantime
+    stays deleted."""
+    if not rows:
+        return
+
+    fields = [field for field in rows[0] if field != 'name']
+    for start in range(0, len(rows), UPDATE_CHUNK_SIZE):
+        chunk = rows[start:start + UPDATE_CHUNK_SIZE]
+        cases = ' '.join(['WHEN %s THEN %s'] * len(chunk))
+        assignments = ', '.join(f'`{field}` = CASE `name` {cases} END' for field in fields)
+        frappe.db.sql(
+            f"UPDATE `tab{doctype}` SET {assignments}, `modified` = %s, `modified_by` = %s "
+            f"WHERE `name` IN ({', '.join(['%s'] * len(chunk))})",
+            [
+                *(value for field in fields for row in chunk for value in (row['name'], row[field])),
+                now_datetime(),
+                frappe.session.user,
+                *(row['name'] for row in chunk),
+            ],
         )
-        frappe.throw(f"Error importing contact: {e}")
@@ -2,8 +2,10 @@
 # See LICENSE
 
 import unittest
+from unittest.mock import patch
 
 import frappe
+import requests
 from shopify.resources import Webhook
 from shopify.session import Session
 
@@ -36,3 +38,37 @@ class TestShopifyConnection(unittest.TestCase):
 		with Session.temp(self.setting.shopify_url, API_VERSION, self.setting.get_password("password")):
 			for wh in Webhook.find():
 				self.assertNotEqual(wh.address, callback_url)
+
+	def test_webhook_subscription_mutation(self):
+		mutation = connection._webhook_subscription_mutation(["orders/create", "orders/partially_fulfilled"])
+
+		self.assertIn("w0: webhookSubscriptionCreate(topic: ORDERS_CREATE", mutation)
+		self.assertIn("w1: webhookSubscriptionCreate(topic: ORDERS_PARTIALLY_FULFILLED", mutation)
+		self.assertTrue(mutation.startswith("mutation($callbackUrl: URL!)"))
+
+	def test_get_next_page_url(self):
+		previous = '<https://frappetest.myshopify.com/admin/api/2024-01/customers.json?limit=250&page_info=abc>; rel="previous"'
+		next_ = '<https://frappetest.myshopify.com/admin/api/2024-01/customers.json?limit=250&page_info=xyz>; rel="next"'
+
+		response = requests.Response()
+		response.headers["Link"] = f"{previous}, {next_}"
+		self.assertEqual(
+			connection._get_next_page_url(response),
+			"https://frappetest.myshopify.com/admin/api/2024-01/customers.json?limit=250&page_info=xyz",
+		)
+
+		response.headers["Link"] = previous
+		self.assertIsNone(connection._get_next_page_url(response))
+
+	def test_wait_for_rate_limit(self):
+		response = requests.Response()
+
+		with patch("ecommerce_integrations.shopify.connection.time.sleep") as sleep:
+			response.headers["X-Shopify-Shop-Api-Call-Limit"] = "10/40"
+			connection._wait_for_rate_limit(response)
+			sleep.assert_not_called()
+
+			# 39 + 1 calls against a threshold of 32 leak down in 4 seconds
+			response.headers["X-Shopify-Shop-Api-Call-Limit"] = "39/40"
+			connection._wait_for_rate_limit(response)
+			sleep.assert_called_once_with(4.0)
@@ -0,0 +1,46 @@
+# Copyright (c) 2021, Frappe and Contributors
+# See LICENSE
+
+import unittest
+from unittest.mock import patch
+
+from ecommerce_integrations.shopify.shopify_bulk import _legacy_id, _to_rest_customer, _utc_timeformat
+
+
+class TestShopifyBulk(unittest.TestCase):
+	def test_legacy_id(self):
+		self.assertEqual(_legacy_id("gid://shopify/Customer/7"), 7)
+		self.assertEqual(_legacy_id("gid://shopify/MailingAddress/42?model_name=CustomerAddress"), 42)
+		self.assertIsNone(_legacy_id(None))
+
+	def test_to_rest_customer(self):
+		node = {
+			"legacyResourceId": "7",
+			"firstName": "Jane",
+			"lastName": "Doe",
+			"email": "jane@example.com",
+			"phone": None,
+			"updatedAt": "2024-01-01T00:00:00Z",
+			"defaultAddress": {"id": "gid://shopify/MailingAddress/2?model_name=CustomerAddress"},
+			"addresses": [
+				{"id": "gid://shopify/MailingAddress/1?model_name=CustomerAddress", "city": "Pune"},
+				{"id": "gid://shopify/MailingAddress/2?model_name=CustomerAddress", "city": "Mumbai"},
+			],
+		}
+
+		customer = _to_rest_customer(node)
+
+		self.assertEqual(customer["id"], 7)
+		self.assertEqual(customer["first_name"], "Jane")
+		self.assertEqual([a["id"] for a in customer["addresses"]], [1, 2])
+		self.assertEqual([a["default"] for a in customer["addresses"]], [False, True])
+
+	def test_utc_timeformat(self):
+		# naive datetimes are in the system timezone, whatever the timezone of the server OS
+		with patch(
+			"ecommerce_integrations.shopify.shopify_bulk.get_system_timezone", return_value="Asia/Kolkata"
+		):
+			self.assertEqual(_utc_timeformat("2024-01-01 05:30:00"), "2024-01-01T00:00:00Z")
+
+		with patch("ecommerce_integrations.shopify.shopify_bulk.get_system_timezone", return_value="UTC"):
+			self.assertEqual(_utc_timeformat("2024-01-01 05:30:00"), "2024-01-01T05:30:00Z")
@@ -0,0 +1,237 @@
+# Copyright (c) 2021, Frappe and Contributors
+# See LICENSE
+
+from datetime import timedelta
+from unittest.mock import patch
+
+import frappe
+import phonenumbers
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import get_datetime
+
+from ecommerce_integrations.shopify import sync_customers
+from ecommerce_integrations.shopify.constants import (
+	ADDRESS_ID_FIELD,
+	CUSTOMER_ID_FIELD,
+	SETTING_DOCTYPE,
+)
+from ecommerce_integrations.shopify.sync_customers import (
+	LAST_SYNC_FIELD,
+	_bulk_insert,
+	_bulk_update,
+	_get_address_rows,
+	_get_countries,
+	_get_inserted,
+	_latest_by_id,
+	_normalize_phone,
+	batch_upsert_addresses,
+	batch_upsert_contacts,
+	batch_upsert_customers,
+)
+
+
+def _shopify_customer(customer_id, **kwargs):
+	return {
+		"id": customer_id,
+		"first_name": "Jane",
+		"last_name": "Doe",
+		"email": f"{customer_id}@example.com",
+		"phone": None,
+		"updated_at": "2024-01-01T00:00:00Z",
+		"addresses": [],
+		**kwargs,
+	}
+
+
+class TestSyncCustomers(FrappeTestCase):
+	def setUp(self):
+		frappe.db.set_single_value(SETTING_DOCTYPE, LAST_SYNC_FIELD, None)
+
+	def test_latest_by_id(self):
+		customers = [
+			{"id": 1, "email": "old@example.com", "updated_at": "2024-01-01T00:00:00Z"},
+			{"id": 2, "email": "other@example.com", "updated_at": "2024-01-01T00:00:00Z"},
+			{"id": 1, "email": "new@example.com", "updated_at": "2024-01-02T00:00:00Z"},
+			{"id": 1, "email": "stale@example.com", "updated_at": "2023-12-31T00:00:00Z"},
+		]
+
+		latest = _latest_by_id(customers)
+
+		self.assertEqual([c["id"] for c in latest], [1, 2])
+		self.assertEqual(latest[0]["email"], "new@example.com")
+
+	def test_batch_upsert_customers(self):
+		customers = [_shopify_customer(9100000001), _shopify_customer(9100000002, phone="555-010-9001")]
+
+		synced = batch_upsert_customers(customers)
+		self.assertFalse(synced["9100000001"].unchanged)
+		customer = frappe.db.get_value(
+			"Customer",
+			{CUSTOMER_ID_FIELD: "9100000002"},
+			["customer_name", "email_id", "mobile_no"],
+			as_dict=True,
+		)
+		self.assertEqual(customer.customer_name, "Jane Doe")
+		self.assertEqual(customer.email_id, "9100000002@example.com")
+		self.assertEqual(customer.mobile_no, "+15550109001")
+
+		# same payload again is skipped, a changed one is written
+		customers[1]["last_name"] = "Roe"
+		synced = batch_upsert_customers(customers)
+		self.assertTrue(synced["9100000001"].unchanged)
+		self.assertFalse(synced["9100000002"].unchanged)
+		self.assertEqual(
+			frappe.db.get_value("Customer", {CUSTOMER_ID_FIELD: "9100000002"}, "customer_name"), "Jane Roe"
+		)
+
+	def test_batch_upsert_addresses(self):
+		customer_data = _shopify_customer(
+			9100000011,
+			addresses=[
+				{"id": 9100000111, "default": True, "address1": "1 Main St", "city": "Pune", "country_code": "IN"},
+				{"id": 9100000112, "address1": "2 Main St", "city": "Nowhere", "country": "Atlantis"},
+			],
+		)
+		customer = batch_upsert_customers([customer_data])["9100000011"]
+
+		batch_upsert_addresses(_get_address_rows(customer, customer_data, _get_countries()))
+
+		address = frappe.get_doc("Address", {ADDRESS_ID_FIELD: "9100000111"})
+		self.assertEqual(address.address_type, "Billing")
+		self.assertEqual(address.country, "India")
+		self.assertEqual([(l.link_doctype, l.link_name) for l in address.links], [("Customer", customer.name)])
+		# unknown countries are left empty instead of writing a broken link
+		self.assertEqual(frappe.db.get_value("Address", {ADDRESS_ID_FIELD: "9100000112"}, "country"), "")
+
+		customer_data["addresses"][0]["city"] = "Mumbai"
+		batch_upsert_addresses(_get_address_rows(customer, customer_data, _get_countries()))
+		self.assertEqual(frappe.db.get_value("Address", address.name, "city"), "Mumbai")
+		self.assertEqual(frappe.db.count("Dynamic Link", {"parent": address.name}), 1)
+
+	def test_get_inserted_skips_duplicates(self):
+		row = {
+			"name": frappe.generate_hash(length=10),
+			ADDRESS_ID_FIELD: "9100000121",
+			"address_title": "Jane Doe",
+			"address_line1": "1 Main St",
+			"city": "Pune",
+			"country": "India",
+		}
+		_bulk_insert("Address", [row])
+		self.assertEqual(_get_inserted("Address", [row]), {row["name"]})
+
+		# same Shopify Address ID under a new name is skipped by the unique index
+		duplicate = {**row, "name": frappe.generate_hash(length=10)}
+		_bulk_insert("Address", [duplicate])
+		self.assertEqual(_get_inserted("Address", [duplicate]), set())
+
+	def test_batch_upsert_contacts(self):
+		jane = _shopify_customer(9100000021, phone="+1 (555) 010-9002")
+		john = _shopify_customer(9100000022, first_name="John", phone="1-555-010-9002")
+		synced = batch_upsert_customers([jane, john])
+
+		batch_upsert_contacts([(synced["9100000021"], jane)])
+		contact = frappe.get_doc("Contact", {"phone": "+15550109002"})
+		self.assertEqual(contact.full_name, "Jane Doe")
+		self.assertEqual([p.phone for p in contact.phone_nos], ["+15550109002"])
+		self.assertEqual([e.email_id for e in contact.email_ids], ["9100000021@example.com"])
+
+		# a second customer sharing the number is linked to the same contact
+		batch_upsert_contacts([(synced["9100000022"], john)])
+		contact.reload()
+		self.assertEqual(frappe.db.count("Contact", {"phone": "+15550109002"}), 1)
+		self.assertEqual(contact.full_name, "John Doe")
+		# the changed email becomes the primary child row too, so a later save keeps it
+		self.assertEqual(contact.email_id, "9100000022@example.com")
+		self.assertEqual(
+			[(e.email_id, e.is_primary) for e in contact.email_ids],
+			[("9100000021@example.com", 0), ("9100000022@example.com", 1)],
+		)
+		self.assertEqual(
+			sorted(l.link_name for l in contact.links),
+			sorted([synced["9100000021"].name, synced["9100000022"].name]),
+		)
+
+	def test_bulk_update(self):
+		synced = batch_upsert_customers([_shopify_customer(9100000031), _shopify_customer(9100000032)])
+		first, second = synced["9100000031"].name, synced["9100000032"].name
+
+		_bulk_update(
+			"Customer",
+			[
+				{"name": first, "customer_name": "First"},
+				{"name": second, "customer_name": "Second"},
+				{"name": "shopify-deleted-customer", "customer_name": "Deleted"},
+			],
+		)
+
+		self.assertEqual(frappe.db.get_value("Customer", first, "customer_name"), "First")
+		self.assertEqual(frappe.db.get_value("Customer", second, "customer_name"), "Second")
+		# only existing documents are updated, deleted ones are not re-created
+		self.assertFalse(frappe.db.exists("Customer", "shopify-deleted-customer"))
+
+	def _run_customer_sync(self, batch_failures):
+		"""Run the coordinator over one customer per batch, then each batch job in order."""
+		customers = [_shopify_customer(9100000041 + idx) for idx in range(len(batch_failures))]
+		with patch.object(sync_customers, "CUSTOMER_BATCH_SIZE", 1), patch.object(
+			sync_customers, "bulk_export_customers", return_value=iter(customers)
+		), patch("frappe.enqueue") as enqueue:
+			sync_customers.enqueue_shopify_customer_pages()
+
+		jobs = [call.kwargs for call in enqueue.call_args_list]
+		self.assertEqual(len(jobs), len(batch_failures))
+		# nothing advances while batches are still pending
+		self.assertIsNone(sync_customers._get_last_customer_sync())
+
+		for job, failed in zip(jobs, batch_failures):
+			with patch.object(sync_customers, "_sync_customer_batch", return_value=failed):
+				sync_customers.sync_customer_batch(job["customers"], job["run_id"], job["started"])
+
+		return jobs[0]["started"]
+
+	def test_watermark_advances_after_last_batch(self):
+		started = self._run_customer_sync([0, 0])
+		self.assertEqual(get_datetime(sync_customers._get_last_customer_sync()), get_datetime(started))
+
+	def test_watermark_kept_when_a_batch_fails(self):
+		self._run_customer_sync([1, 0])
+		self.assertIsNone(sync_customers._get_last_customer_sync())
+
+	def test_watermark_only_moves_forward(self):
+		started = self._run_customer_sync([0])
+
+		sync_customers._set_last_customer_sync(get_datetime(started) - timedelta(hours=1))
+		self.assertEqual(get_datetime(sync_customers._get_last_customer_sync()), get_datetime(started))
+
+	def test_sync_customer_batch_retries_per_customer(self):
+		customers = [_shopify_customer(9100000051), _shopify_customer(9100000052)]
+
+		def upsert(batch):
+			if any(c["id"] == 9100000052 for c in batch):
+				raise frappe.ValidationError("bad customer")
+
+		with patch.object(sync_customers, "_upsert_customers", side_effect=upsert) as upsert_customers, patch.object(
+			frappe.db, "commit"
+		), patch.object(frappe.db, "rollback"), patch("frappe.log_error") as log_error:
+			failed = sync_customers._sync_customer_batch(customers)
+
+		self.assertEqual(failed, 1)
+		# whole batch first, then one customer per transaction
+		self.assertEqual(
+			[[c["id"] for c in call.args[0]] for call in upsert_customers.call_args_list],
+			[[9100000051, 9100000052], [9100000051], [9100000052]],
+		)
+		log_error.assert_called_once()
+		self.assertIn("Customer 9100000052", log_error.call_args.args[0])
+
+	def test_normalize_phone_matches_phonenumbers(self):
+		# the US fast path must agree with phonenumbers, other numbers fall through to it
+		for phone in ("1234567890", "+1 (555) 123-4567", "1-555-123-4567", "+44 20 7946 0958"):
+			with self.subTest(phone=phone):
+				expected = phonenumbers.format_number(
+					phonenumbers.parse(phone, "US"), phonenumbers.PhoneNumberFormat.E164
+				)
+				self.assertEqual(_normalize_phone(phone), expected)
+
+		self.assertIsNone(_normalize_phone(""))
+		self.assertIsNone(_normalize_phone("not a phone"))